@@ -3,15 +3,21 @@
 
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
-import tempfile
 from typing import Any
 
 import streamlit as st
 
-from expense_core import check_rows, make_summary, normalize_ok_rows, read_csv, write_csv
-from excel_export import write_xlsx_report
-from html_report import write_html_report
+from expense_core import (
+    check_rows,
+    iter_csv_from_bytes,
+    make_summary,
+    normalize_ok_rows,
+    rows_to_csv_bytes,
+)
+from excel_export import build_xlsx_report
+from html_report import render_html_report
 from rules import apply_rules, load_rules
 
 # Streamlit のセッション間でパイプライン結果を保持するためのキー
@@ -20,6 +26,31 @@ from rules import apply_rules, load_rules
 LAST_RUN_KEY = "last_run"
 SAMPLE_BAD_CSV_PATH = Path("data/sample_bad.csv")
 SAMPLE_GOOD_CSV_PATH = Path("data/sample_good.csv")
+# 画面の表に一度に表示する最大行数（全件は「Show all rows」か CSV ダウンロードで確認する）
+PREVIEW_ROWS = 500
+
+# (出力キー, ファイル名のベース, 列) の一覧。CSV 出力はこの表から生成する
+CSV_OUTPUTS = [
+    ("errors_csv", "errors", ["row", "date", "amount", "merchant", "category", "reason"]),
+    (
+        "warnings_csv",
+        "warnings",
+        ["kind", "row", "date", "month", "category", "merchant", "amount", "message"],
+    ),
+    ("clean_csv", "clean", ["date", "amount", "merchant", "category"]),
+    ("summary_csv", "summary", ["type", "key", "value"]),
+]
+
+# (出力キー, ボタンのラベル, MIMEタイプ) の一覧。再実行のたびに作り直さないよう定数にしておく
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+DOWNLOAD_SPECS = (
+    ("errors_csv", "Download errors.csv", "text/csv"),
+    ("warnings_csv", "Download warnings.csv", "text/csv"),
+    ("clean_csv", "Download clean.csv", "text/csv"),
+    ("summary_csv", "Download summary.csv", "text/csv"),
+    ("report_xlsx", "Download report.xlsx", XLSX_MIME),
+    ("report_html", "Download report.html", "text/html"),
+)
 
 
 st.set_page_config(page_title="Expense Tool", layout="wide")
@@ -30,118 +61,170 @@ def _ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-def _save_upload(uploaded_file, dir_path: Path) -> Path:
-    """アップロードされたファイルを一時ディレクトリに保存してパスを返す。
+def _stamp_name(prefix: str, base: str, ext: str) -> str:
+    return f"{prefix}_{base}.{ext}"
+
 
-    Streamlit のアップロードオブジェクトはメモリ上のバッファなので、
-    ファイルパスを必要とする処理（csv.reader など）のために一度ディスクに書き出す。
+def _fast_hash(data: bytes) -> str:
+    """CSV の中身を表す短いハッシュ値（キャッシュキー用）を返す。
+
+    blake2b は hashlib の C 実装で高速なうえ、digest_size=16 で十分に衝突しにくい。
     """
-    path = dir_path / uploaded_file.name
-    path.write_bytes(uploaded_file.getbuffer())
-    return path
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
-def _stamp_name(prefix: str, base: str, ext: str) -> str:
-    return f"{prefix}_{base}.{ext}"
+@st.cache_data(max_entries=16, show_spinner=False)
+def _compute(
+    content_hash: str,
+    _csv_bytes: bytes,
+    rules_path_str: str,
+    rules_mtime_ns: int,
+    rules_size: int,
+    top_n: int,
+) -> tuple[list, list, list, list]:
+    """CSV読み込みから集計までの「純粋な計算部分」を実行する。
+
+    Streamlit はウィジェットを操作するたびにスクリプト全体を再実行するため、
+    入力（CSV の中身・rules.json の版・top_n）が同じなら結果をキャッシュから返す。
+
+    CSV の中身は content_hash（_fast_hash の結果）でキャッシュキーにする。
+    先頭が "_" の引数は Streamlit がハッシュ対象から外すので、
+    大きな _csv_bytes を毎回ハッシュし直すコストがかからない。
+    rules_mtime_ns / rules_size は中身では使わないが、キーに含めることで rules.json の更新後は
+    再計算される（load_rules と同じく、更新時刻の粒度が粗くてもサイズの違いで検知できる）。
+
+    returns:
+      errors, warnings, clean_rows, summary
+    """
+    # 1行ずつ読みながらチェックするので、読み込んだ全行のリストをメモリに持たない
+    ok_rows, errors = check_rows(iter_csv_from_bytes(_csv_bytes))
+    # load_rules 自体がファイルの版（パス・更新時刻・サイズ）ごとにキャッシュしている
+    rules = load_rules(Path(rules_path_str))
+    ok_norm = normalize_ok_rows(ok_rows)
+    clean_rows, warnings = apply_rules(ok_norm, rules)
+    summary = make_summary(clean_rows, top_n=top_n)
+    return errors, warnings, clean_rows, summary
+
+
+def _render_payloads(
+    *,
+    prefix: str,
+    errors: list[dict],
+    warnings: list[dict],
+    clean: list[dict],
+    summary: list[dict],
+    do_excel: bool,
+    do_html: bool,
+) -> tuple[dict[str, bytes], dict[str, str]]:
+    """各出力をメモリ上のバイト列として生成し、(キー→バイト列, キー→ファイル名) を返す。
+
+    ダウンロードボタンにはバイト列を渡せばよいので、ディスクを経由しない。
+    結果は session_state に保持されるため、再実行のたびにファイルを読み直す必要もない。
+    """
+    tables = {"errors": errors, "warnings": warnings, "clean": clean, "summary": summary}
+    payloads = {key: rows_to_csv_bytes(tables[base], columns) for key, base, columns in CSV_OUTPUTS}
+    file_names = {key: _stamp_name(prefix, base, "csv") for key, base, _ in CSV_OUTPUTS}
+
+    if do_excel:
+        payloads["report_xlsx"] = build_xlsx_report(
+            errors=errors, warnings=warnings, clean=clean, summary=summary
+        )
+        file_names["report_xlsx"] = _stamp_name(prefix, "report", "xlsx")
+    if do_html:
+        payloads["report_html"] = render_html_report(
+            errors=errors,
+            warnings=warnings,
+            clean=clean,
+            summary=summary,
+            title="Expense Tool Report",
+        ).encode("utf-8")
+        file_names["report_html"] = _stamp_name(prefix, "report", "html")
+
+    return payloads, file_names
+
+
+def _save_payloads(
+    out_dir: Path, payloads: dict[str, bytes], file_names: dict[str, str]
+) -> dict[str, Path]:
+    """生成済みのバイト列を out_dir に書き出し、キーごとの出力パスを返す。
+
+    「Also save files to disk」がオンのときだけ呼ばれる。
+    """
+    _ensure_dir(out_dir)
+    output_paths: dict[str, Path] = {}
+    for key, payload in payloads.items():
+        path = out_dir / file_names[key]
+        path.write_bytes(payload)
+        output_paths[key] = path
+    return output_paths
 
 
 def _run_pipeline(
     *,
-    csv_path: Path,
+    source_name: str,
+    csv_bytes: bytes,
     rules_path: Path,
     out_dir: Path,
     top_n: int,
+    save_files: bool,
     do_excel: bool,
     do_html: bool,
 ) -> dict[str, Any]:
     """CSVチェックからレポート生成までの一連の処理をまとめたパイプライン関数。
 
     処理の流れ:
-      1. CSV読み込み（read_csv）
+      1. CSV読み込み（iter_csv_from_bytes）
       2. 基本バリデーション（check_rows） → errors / ok_rows に振り分け
       3. ルール設定の読み込み（load_rules）
       4. 型の正規化（normalize_ok_rows）
       5. ビジネスルール適用（apply_rules） → clean_rows / warnings に振り分け
       6. 集計（make_summary）
-      7. 各種ファイルへの書き出し（CSV / Excel / HTML）
+      7. 出力（CSV / Excel / HTML）のバイト列生成と、必要ならディスクへの保存
 
+    1〜6 は _compute（キャッシュあり）、7 は _render_payloads / _save_payloads が担当する。
     Keyword-only 引数（*）を使うことで、呼び出し元での引数の順序ミスを防いでいる。
     """
-    _ensure_dir(out_dir)
-    prefix = csv_path.stem
-
-    rows = read_csv(str(csv_path))
-    ok_rows, errors = check_rows(rows)
-    rules = load_rules(rules_path)
-    ok_norm = normalize_ok_rows(ok_rows)
-    clean_rows, warnings = apply_rules(ok_norm, rules)
-    summary = make_summary(clean_rows, top_n=top_n)
-
-    errors_csv = out_dir / _stamp_name(prefix, "errors", "csv")
-    warnings_csv = out_dir / _stamp_name(prefix, "warnings", "csv")
-    clean_csv = out_dir / _stamp_name(prefix, "clean", "csv")
-    summary_csv = out_dir / _stamp_name(prefix, "summary", "csv")
-
-    write_csv(str(errors_csv), errors, ["row", "date", "amount", "merchant", "category", "reason"])
-    write_csv(
-        str(warnings_csv),
-        warnings,
-        ["kind", "row", "date", "month", "category", "merchant", "amount", "message"],
+    content_hash = _fast_hash(csv_bytes)
+    rules_stat = rules_path.stat()
+    errors, warnings, clean_rows, summary = _compute(
+        content_hash,
+        csv_bytes,
+        str(rules_path),
+        rules_stat.st_mtime_ns,
+        rules_stat.st_size,
+        top_n,
     )
-    write_csv(str(clean_csv), clean_rows, ["date", "amount", "merchant", "category"])
-    write_csv(str(summary_csv), summary, ["type", "key", "value"])
-
-    output_paths: dict[str, Path] = {
-        "errors_csv": errors_csv,
-        "warnings_csv": warnings_csv,
-        "clean_csv": clean_csv,
-        "summary_csv": summary_csv,
-    }
-
-    xlsx_path = out_dir / _stamp_name(prefix, "report", "xlsx")
-    html_path = out_dir / _stamp_name(prefix, "report", "html")
 
-    if do_excel:
-        write_xlsx_report(
-            path=xlsx_path,
-            errors=errors,
-            warnings=warnings,
-            clean=clean_rows,
-            summary=summary,
-        )
-        output_paths["report_xlsx"] = xlsx_path
-
-    if do_html:
-        write_html_report(
-            path=html_path,
-            errors=errors,
-            warnings=warnings,
-            clean=clean_rows,
-            summary=summary,
-            title="Expense Tool Report",
-        )
-        output_paths["report_html"] = html_path
+    payloads, file_names = _render_payloads(
+        prefix=Path(source_name).stem,
+        errors=errors,
+        warnings=warnings,
+        clean=clean_rows,
+        summary=summary,
+        do_excel=do_excel,
+        do_html=do_html,
+    )
+    output_paths = _save_payloads(out_dir, payloads, file_names) if save_files else {}
 
     return {
-        "source_name": csv_path.name,
+        "source_name": source_name,
         "errors": errors,
         "warnings": warnings,
         "summary": summary,
         "output_paths": {k: str(v) for k, v in output_paths.items()},
+        "payloads": payloads,
+        "file_names": file_names,
         "enabled_outputs": {"excel": do_excel, "html": do_html},
     }
 
 
-def _read_bytes(path: Path) -> bytes | None:
-    """ファイルをバイト列で読み込む。読めない場合は None を返す。
-
-    出力ファイルが存在しない・権限エラーなどの場合でも
-    例外を呼び出し元に伝播させず、None で安全に処理を継続させるための wrapper。
-    """
-    try:
-        return path.read_bytes()
-    except OSError:
-        return None
+def _show_table(rows: list[dict], *, show_all: bool) -> None:
+    """行のリストを表として表示する。show_all=False なら先頭 PREVIEW_ROWS 行だけ表示する。"""
+    if show_all or len(rows) <= PREVIEW_ROWS:
+        st.dataframe(rows, width="stretch")
+        return
+    st.dataframe(rows[:PREVIEW_ROWS], width="stretch")
+    st.caption(f"Showing first {PREVIEW_ROWS} of {len(rows)} rows")
 
 
 with st.sidebar:
@@ -154,6 +237,7 @@ with st.sidebar:
     st.header("Outputs")
     do_excel = st.checkbox("Generate Excel (.xlsx)", value=True)
     do_html = st.checkbox("Generate HTML report", value=True)
+    save_files = st.checkbox("Also save files to disk", value=False)
 
     run_upload_btn = st.button("Run with uploaded CSV", type="primary")
     sample_col_bad, sample_col_good = st.columns(2)
@@ -179,39 +263,38 @@ if run_upload_btn or run_sample_bad_btn or run_sample_good_btn:
                 if uploaded_csv is None:
                     run_error = "Please upload a CSV file before running."
                 else:
-                    # アップロードファイルは一時ディレクトリに保存してパイプラインに渡す。
-                    # TemporaryDirectory を使うことで、処理後に自動でディスクから削除される。
-                    # Streamlit Cloud / Render のような制約ある環境でも安全に動作する。
-                    with tempfile.TemporaryDirectory() as tmp:
-                        csv_path = _save_upload(uploaded_csv, Path(tmp))
-                        result = _run_pipeline(
-                            csv_path=csv_path,
-                            rules_path=rules_path,
-                            out_dir=out_dir,
-                            top_n=int(top_n),
-                            do_excel=do_excel,
-                            do_html=do_html,
-                        )
-                        if result is not None:
-                            # 一時ディレクトリは with ブロック終了後に削除されるため、
-                            # ダウンロード用にバイト列を事前にメモリへ保持しておく
-                            result["source_bytes"] = uploaded_csv.getvalue()
+                    # アップロードファイルはメモリ上のバイト列のままパイプラインに渡す。
+                    # 一時ファイルに書き出さないので、ディスクへの往復が発生しない。
+                    csv_bytes = uploaded_csv.getvalue()
+                    result = _run_pipeline(
+                        source_name=uploaded_csv.name,
+                        csv_bytes=csv_bytes,
+                        rules_path=rules_path,
+                        out_dir=out_dir,
+                        top_n=int(top_n),
+                        save_files=save_files,
+                        do_excel=do_excel,
+                        do_html=do_html,
+                    )
+                    result["source_bytes"] = csv_bytes
             else:
                 sample_csv_path = SAMPLE_BAD_CSV_PATH if run_sample_bad_btn else SAMPLE_GOOD_CSV_PATH
                 if not sample_csv_path.exists():
                     run_error = f"Sample CSV not found: {sample_csv_path}"
                 else:
+                    csv_bytes = sample_csv_path.read_bytes()
                     result = _run_pipeline(
-                        csv_path=sample_csv_path,
+                        source_name=sample_csv_path.name,
+                        csv_bytes=csv_bytes,
                         rules_path=rules_path,
                         out_dir=out_dir,
                         top_n=int(top_n),
+                        save_files=save_files,
                         do_excel=do_excel,
                         do_html=do_html,
                     )
-                    if result is not None:
-                        result["source_path"] = str(sample_csv_path.resolve())
-                        result["source_bytes"] = _read_bytes(sample_csv_path)
+                    result["source_path"] = str(sample_csv_path.resolve())
+                    result["source_bytes"] = csv_bytes
         except Exception as exc:
             # パイプライン内の予期しないエラーをキャッチしてユーザーに表示する。
             # スタックトレースをそのまま出すと UX が悪いため、メッセージのみ表示する。
@@ -252,47 +335,44 @@ if isinstance(source_bytes, bytes):
         key="download_source_csv",
     )
 
+# 既定では先頭 PREVIEW_ROWS 行だけをブラウザに送る。
+# st.dataframe は再実行のたびに全行をシリアライズして送るため、行数が多いと表示が重くなる。
+show_all_rows = st.toggle("Show all rows", value=False)
+
 col1, col2 = st.columns(2)
 with col1:
     st.subheader("Errors")
     st.write(f"Count: {len(errors)}")
-    st.dataframe(errors, width="stretch")
+    _show_table(errors, show_all=show_all_rows)
 with col2:
     st.subheader("Warnings")
     st.write(f"Count: {len(warnings)}")
-    st.dataframe(warnings, width="stretch")
+    _show_table(warnings, show_all=show_all_rows)
 
 st.subheader("Summary")
-st.dataframe(summary, width="stretch")
+_show_table(summary, show_all=show_all_rows)
 
 st.subheader("Generated files")
-for path in output_paths.values():
-    st.write(f"- `{path}`")
-
-# 各出力ファイルをバイト列として読み込み、ダウンロードボタンを生成する。
-# ファイルが存在しない（例: Excel 未選択）場合はそのキーをスキップする。
+if output_paths:
+    for path in output_paths.values():
+        st.write(f"- `{path}`")
+else:
+    st.caption("Not saved to disk (enable 'Also save files to disk' to write files).")
+
+# 各出力はメモリ上のバイト列として保持済みなので、そのままダウンロードボタンに渡す。
+# 出力が存在しない（例: Excel 未選択）場合はそのキーをスキップする。
 st.subheader("Download outputs")
-download_specs = [
-    ("errors_csv", "Download errors.csv", "text/csv"),
-    ("warnings_csv", "Download warnings.csv", "text/csv"),
-    ("clean_csv", "Download clean.csv", "text/csv"),
-    ("summary_csv", "Download summary.csv", "text/csv"),
-    ("report_xlsx", "Download report.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
-    ("report_html", "Download report.html", "text/html"),
-]
+payloads = last_run.get("payloads", {})
+file_names = last_run.get("file_names", {})
 
-for key, label, mime in download_specs:
-    path = output_paths.get(key)
-    if path is None:
-        continue
-    payload = _read_bytes(path)
+for key, label, mime in DOWNLOAD_SPECS:
+    payload = payloads.get(key)
     if payload is None:
-        st.warning(f"Could not read output file for download: {path}")
         continue
     st.download_button(
         label=label,
         data=payload,
-        file_name=path.name,
+        file_name=file_names[key],
         mime=mime,
         key=f"download_{key}",
     )
@@ -4,19 +4,29 @@ excel_export.py
 Excel（.xlsx）を生成する
 シート: Errors / Warnings / Summary / Clean / Charts
 見栄え: フィルタ / 列幅調整 / ヘッダ太字 / フリーズ
+書き込み: openpyxl の write_only モード（ストリーミング）
 グラフ: 月別推移(棒) / カテゴリ比率(円)
 """
 
 from __future__ import annotations
 
+import io
 from pathlib import Path
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.chart import BarChart, PieChart, Reference
 from openpyxl.chart.label import DataLabelList
 from openpyxl.styles import Alignment, Font
 from openpyxl.utils import get_column_letter
 
+from expense_core import iter_row_values
+
+# 見出し用のスタイル。実行ごと・シートごとに作り直さず、モジュール全体で使い回す
+# （openpyxl のスタイルオブジェクトは不変なので共有しても安全）
+HEADER_FONT = Font(bold=True)
+HEADER_ALIGNMENT = Alignment(vertical="center")
+
 
 def write_xlsx_report(
     *,
@@ -38,13 +48,40 @@ def write_xlsx_report(
     出力先ディレクトリが存在しない場合は自動生成する。
     Render のような環境ではデプロイ時にディレクトリが存在しない場合があるため、
     mkdir を明示的に呼んでいる。
+
+    write_only=True（ストリーミング書き込み）で作ることで、全セルを Cell オブジェクトとして
+    メモリに抱えずに済み、行数が多くてもメモリ使用量と処理時間を抑えられる。
+    その代わり、書き込んだセルを後から読み書きできない点に注意する。
+    write_only の Workbook はデフォルトシートを作らないので、削除処理も不要。
     """
-    wb = Workbook()
+    wb = _build_workbook(errors=errors, warnings=warnings, clean=clean, summary=summary)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(path)
 
-    # Workbook 作成時に自動生成されるデフォルトシートは不要なので削除する
-    # これをやらないと意図しない空シートが先頭に残ってしまう
-    default = wb.active
-    wb.remove(default)
+
+def build_xlsx_report(
+    *,
+    errors: list[dict],
+    warnings: list[dict],
+    clean: list[dict],
+    summary: list[dict],
+) -> bytes:
+    """Excelレポートをファイルに保存せず、xlsx のバイト列として返す（GUI のダウンロード用）。"""
+    wb = _build_workbook(errors=errors, warnings=warnings, clean=clean, summary=summary)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _build_workbook(
+    *,
+    errors: list[dict],
+    warnings: list[dict],
+    clean: list[dict],
+    summary: list[dict],
+) -> Workbook:
+    """レポート用の Workbook を組み立てる（保存は呼び出し元が行う）。"""
+    wb = Workbook(write_only=True)
 
     _add_table_sheet(
         wb, "Errors", errors, ["row", "date", "amount", "merchant", "category", "reason"]
@@ -61,8 +98,7 @@ def write_xlsx_report(
     charts_ws = wb.create_sheet("Charts")
     _build_charts(charts_ws, summary)
 
-    path.parent.mkdir(parents=True, exist_ok=True)
-    wb.save(path)
+    return wb
 
 
 def _add_table_sheet(wb: Workbook, title: str, rows: list[dict], columns: list[str]) -> None:
@@ -70,48 +106,44 @@ def _add_table_sheet(wb: Workbook, title: str, rows: list[dict], columns: list[s
 
     ヘッダを太字にし、先頭行をフリーズ、オートフィルタを設定することで
     Excelで開いたときに操作しやすいレイアウトにしている。
-    列幅は内容に応じて自動調整する（_auto_width）。
+
+    列幅は内容に応じて自動調整する。write_only のシートは書き込み後に
+    セルを読み戻せないうえ、列幅は行より先に設定しておく必要がある。
+    そこで元の辞書リストを1回だけ走査し、書き込む値のリストを作りながら
+    各列の最大文字数も同時に数える（max_width で上限を設ける）。
     """
     ws = wb.create_sheet(title)
 
-    # header
-    ws.append(columns)
-    header_font = Font(bold=True)
-    for col_idx in range(1, len(columns) + 1):
-        c = ws.cell(row=1, column=col_idx)
-        c.font = header_font
-        c.alignment = Alignment(vertical="center")
+    # 値の取り出しと列幅の計算を1パスで行う
+    widths = [len(c) for c in columns]
+    table: list[tuple] = []
+    for values in iter_row_values(rows, columns):
+        for i, v in enumerate(values):
+            n = len(str(v))
+            if n > widths[i]:
+                widths[i] = n
+        table.append(values)
 
-    # rows
-    for r in rows:
-        ws.append([r.get(c, "") for c in columns])
+    max_width = 50
+    for col_idx, w in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = min(w + 2, max_width)
 
     # 先頭行を固定し、フィルタを有効にする（データ量が多い場合の操作性向上）
     ws.freeze_panes = "A2"
-    ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}{max(1, ws.max_row)}"
-
-    _auto_width(ws, max_width=50)
-
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}{len(rows) + 1}"
 
-def _auto_width(ws, max_width: int = 60) -> None:
-    """各列の最大文字数に応じて列幅を自動調整する。
+    # header
+    header = []
+    for col in columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        header.append(cell)
+    ws.append(header)
 
-    openpyxl はデフォルトで列幅を自動調整しないため、
-    手動でセル内容の最大文字数を計算して適用する。
-    max_width で上限を設けることで、長い文字列による列の過剰な広がりを防ぐ。
-    """
-    for col_idx in range(1, ws.max_column + 1):
-        letter = get_column_letter(col_idx)
-        # 各列の最大文字数（ざっくり）
-        max_len = 0
-        for row in range(1, ws.max_row + 1):
-            v = ws.cell(row=row, column=col_idx).value
-            if v is None:
-                continue
-            s = str(v)
-            if len(s) > max_len:
-                max_len = len(s)
-        ws.column_dimensions[letter].width = min(max_len + 2, max_width)
+    # rows
+    for values in table:
+        ws.append(values)
 
 
 def _build_charts(ws, summary: list[dict]) -> None:
@@ -126,26 +158,25 @@ def _build_charts(ws, summary: list[dict]) -> None:
     テーブルをシートに書き込んでからそれを参照する構造にすることで、
     グラフデータが Excel 上でも確認・編集しやすい状態になる。
     """
-    ws["A1"] = "Month totals"
-    ws["A1"].font = Font(bold=True)
+    # write_only のシートはセル番地を指定して書けないので、すべて append で上から積む
+    ws.append([_bold_cell(ws, "Month totals")])  # row1
 
     # summary はフラット構造なので type でフィルタしてグラフ用データを取り出す
-    month_rows = [
-        (r["key"], int(r["value"]))
-        for r in summary
-        if r.get("type") == "month_total" and r.get("key") not in ("month",)
-    ]
-    cat_rows = [
-        (r["key"], int(r["value"]))
-        for r in summary
-        if r.get("type") == "category_total" and r.get("key") not in ("category",)
-    ]
-
-    # 月別表（A3:B...）
-    ws.append([])  # A2 empty
-    ws.append(["month", "total_amount"])  # row3
-    for m, v in month_rows:
-        ws.append([m, v])
+    # 月別・カテゴリ別を1回の走査で振り分ける（ヘッダ行 "month" / "category" は除く）
+    month_rows: list[tuple[str, int]] = []
+    cat_rows: list[tuple[str, int]] = []
+    for r in summary:
+        t = r.get("type")
+        k = r.get("key")
+        if t == "month_total" and k != "month":
+            month_rows.append((r["key"], int(r["value"])))
+        elif t == "category_total" and k != "category":
+            cat_rows.append((r["key"], int(r["value"])))
+
+    # 月別表（A3:B...）。ヘッダとデータ行をまとめて1つのブロックにしてから書き込む
+    month_block = [[], ["month", "total_amount"], *([m, v] for m, v in month_rows)]  # A2 empty
+    for row in month_block:
+        ws.append(row)
 
     month_start = 3
     month_end = 3 + len(month_rows)
@@ -166,13 +197,13 @@ def _build_charts(ws, summary: list[dict]) -> None:
 
     # カテゴリ表（月別表の直下に配置）
     row0 = month_end + 3
-    ws[f"A{row0}"] = "Category totals"
-    ws[f"A{row0}"].font = Font(bold=True)
-
     ws.append([])  # blank
-    ws.append(["category", "total_amount"])
-    for c, v in cat_rows:
-        ws.append([c, v])
+    ws.append([])  # blank
+    ws.append([_bold_cell(ws, "Category totals")])  # row0
+
+    cat_block = [[], ["category", "total_amount"], *([c, v] for c, v in cat_rows)]  # blank
+    for row in cat_block:
+        ws.append(row)
 
     cat_header_row = row0 + 2
     cat_start = cat_header_row
@@ -186,3 +217,10 @@ def _build_charts(ws, summary: list[dict]) -> None:
         pie.add_data(data, titles_from_data=True)
         pie.set_categories(labels)
         ws.add_chart(pie, f"D{cat_start}")
+
+
+def _bold_cell(ws, value: str) -> WriteOnlyCell:
+    """write_only シート用の太字セルを作る（見出し用）。"""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = HEADER_FONT
+    return cell
@@ -13,9 +13,9 @@ from pathlib import Path
 from excel_export import write_xlsx_report
 from expense_core import (
     check_rows,
+    iter_csv,
     make_summary,
     normalize_ok_rows,
-    read_csv,
     write_csv,
 )
 from html_report import write_html_report
@@ -93,11 +93,10 @@ def main(argv: list[str] | None = None) -> int:
     # timestamp ありのときだけファイル名に付ける
     ts = datetime_now_stamp() if args.timestamp else None
 
-    # 1) 取り込み
-    rows = read_csv(str(csv_path))
-
-    # 2) 構造チェック（必須列、日付形式、金額、重複など） -> errors
-    ok_rows, errors = check_rows(rows)
+    # 1) 取り込み + 2) 構造チェック（必須列、日付形式、金額、重複など） -> errors
+    # iter_csv で1行ずつ読みながらチェックするので、入力CSV全体をメモリに載せない
+    ok_rows, errors = check_rows(iter_csv(str(csv_path)))
+    total_rows = len(ok_rows) + len(errors)  # 各行は ok_rows か errors のどちらかに入る
 
     # 3) ルールチェック（カテゴリ許可、禁止ワード、日付範囲、上限など） -> warnings
     rules = load_rules(rules_path)
@@ -171,7 +170,7 @@ def main(argv: list[str] | None = None) -> int:
     print(f"  excel:    {xlsx_path}")
     print(f"  html:     {html_path}")
     print(
-        f"  全体: {len(rows)} / OK: {len(ok_rows)} / エラー: {len(errors)} / 警告: {len(warnings)}"
+        f"  全体: {total_rows} / OK: {len(ok_rows)} / エラー: {len(errors)} / 警告: {len(warnings)}"
     )
 
     return 2 if len(errors) > 0 else 0
@@ -11,6 +11,13 @@ from __future__ import annotations
 import json
 from html import escape
 from pathlib import Path
+from typing import Iterator
+
+from expense_core import IO_BUFFER_SIZE
+
+# html.escape(quote=True) と同じ置換表。str.translate で1回の走査でエスケープできる
+# （html.escape は replace を5回繰り返すため、セル数が多いと差が出る）。
+_HTML_ESC = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
 
 
 def write_html_report(
@@ -24,6 +31,56 @@ def write_html_report(
 ) -> None:
     """HTML形式のレポートファイルを生成して保存する。
 
+    render_html_report のように文書全体を1本の文字列にまとめず、
+    iter_html_report が返す断片をそのままファイルへ書き出す（巨大な中間文字列を作らない）。
+
+    断片は生成しながら書くため、途中で例外が起きると書きかけのファイルが残ってしまう。
+    そこでいったん同じフォルダの一時ファイルに書き、最後まで書けたときだけ path に置き換える。
+    失敗した場合は一時ファイルを消し、既存の path には手を付けない。
+    """
+    chunks = iter_html_report(
+        errors=errors, warnings=warnings, clean=clean, summary=summary, title=title
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8", buffering=IO_BUFFER_SIZE) as f:
+            f.writelines(chunks)
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def render_html_report(
+    *,
+    errors: list[dict],
+    warnings: list[dict],
+    clean: list[dict],
+    summary: list[dict],
+    title: str = "Expense Tool Report",
+) -> str:
+    """HTML形式のレポートを文字列として生成する（iter_html_report の断片を連結したもの）。
+
+    ファイルに保存せず文字列で返すので、GUI ではそのままダウンロードボタンに渡せる。
+    """
+    return "".join(
+        iter_html_report(
+            errors=errors, warnings=warnings, clean=clean, summary=summary, title=title
+        )
+    )
+
+
+def iter_html_report(
+    *,
+    errors: list[dict],
+    warnings: list[dict],
+    clean: list[dict],
+    summary: list[dict],
+    title: str = "Expense Tool Report",
+) -> Iterator[str]:
+    """HTMLレポートを先頭から順に、文字列の断片として1つずつ返す。
+
     グラフは Chart.js（CDN）を使い、サーバーサイドでの画像生成を不要にしている。
     これにより、Matplotlib などの依存を増やさずに視覚的なレポートを実現できる。
 
@@ -55,7 +112,7 @@ def write_html_report(
     warnings_head = warnings[:200]
     clean_head = clean[:200]
 
-    html = f"""<!doctype html>
+    yield f"""<!doctype html>
 <html lang="ja">
 <head>
   <meta charset="utf-8" />
@@ -93,18 +150,28 @@ def write_html_report(
 
   <div class="card" style="margin-top:16px;">
     <h2>Errors（先頭200件）</h2>
-    {table_html(errors_head, ["row", "date", "amount", "merchant", "category", "reason"])}
+    """
+    yield from iter_table_html(
+        errors_head, ["row", "date", "amount", "merchant", "category", "reason"]
+    )
+    yield """
   </div>
 
   <div class="card" style="margin-top:16px;">
     <h2>Warnings（先頭200件）</h2>
-    {table_html(warnings_head, ["kind", "row", "date", "month", "category", "merchant", "amount",
-                                "message"])}
+    """
+    yield from iter_table_html(
+        warnings_head,
+        ["kind", "row", "date", "month", "category", "merchant", "amount", "message"],
+    )
+    yield """
   </div>
 
   <div class="card" style="margin-top:16px;">
     <h2>Clean（先頭200件）</h2>
-    {table_html(clean_head, ["date", "amount", "merchant", "category"])}
+    """
+    yield from iter_table_html(clean_head, ["date", "amount", "merchant", "category"])
+    yield f"""
   </div>
 
   <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
@@ -146,24 +213,32 @@ def write_html_report(
 </body>
 </html>
 """
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(html, encoding="utf-8")
 
 
 def table_html(rows: list[dict], columns: list[str]) -> str:
-    """辞書のリストをHTML表に変換する。
+    """辞書のリストをHTML表に変換する（iter_table_html の断片を連結したもの）。"""
+    return "".join(iter_table_html(rows, columns))
 
-    セル値には必ず escape() を適用する。
+
+def iter_table_html(rows: list[dict], columns: list[str]) -> Iterator[str]:
+    """辞書のリストをHTML表にし、ヘッダ・各行・閉じタグを順に返す。
+
+    セル値には必ずエスケープ（escape() と同じ置換表 _HTML_ESC）を適用する。
     CSVの内容に "<script>" のような文字列が含まれていた場合に
     HTML として解釈されてしまう XSS を防ぐため。
     """
     if not rows:
-        return "<p class='muted'>（なし）</p>"
+        yield "<p class='muted'>（なし）</p>"
+        return
 
     ths = "".join(f"<th>{escape(c)}</th>" for c in columns)
-    trs = []
+    yield f"<table><thead><tr>{ths}</tr></thead><tbody>"
+
+    # 行のテンプレート（"<tr><td>{}</td>...</tr>"）を列数ぶん1回だけ作っておき、
+    # 各行はエスケープ済みの値を format で流し込むだけにする。
+    # セルごとの f-string と join を省き、中間文字列の生成を減らすため。
+    row_tmpl = "<tr>" + "<td>{}</td>" * len(columns) + "</tr>"
     for r in rows:
-        tds = "".join(f"<td>{escape(str(r.get(c, '')))}</td>" for c in columns)
-        trs.append(f"<tr>{tds}</tr>")
+        yield row_tmpl.format(*[str(r.get(c, "")).translate(_HTML_ESC) for c in columns])
 
-    return f"<table><thead><tr>{ths}</tr></thead><tbody>{''.join(trs)}</tbody></table>"
+    yield "</tbody></table>"
@@ -12,18 +12,38 @@ apply_rules は (clean_rows, warnings) を返す。
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass
-from datetime import datetime
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
+from typing import Any, Callable
 
+from expense_core import parse_date
 
-@dataclass(frozen=True)
+# orjson はあれば使う（任意の依存）。bytes をそのまま解析でき、標準の json より速い。
+# 入っていない環境では標準ライブラリの json.loads で同じ結果になる。
+_json_loads: Callable[[str | bytes], Any]
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+
+# unknown_category_mode として受け付ける値
+_MODES = frozenset({"warn", "ignore", "fallback"})
+
+
+@dataclass(frozen=True, slots=True)
 class DateRange:
     min: str | None = None  # "YYYY-MM-DD"
     max: str | None = None  # "YYYY-MM-DD"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Limits:
     daily_total: int | None = None
     monthly_total: int | None = None
@@ -31,7 +51,7 @@ class Limits:
     category_monthly: dict[str, int] | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Rules:
     allowed_categories: list[str] | None = None
     unknown_category_mode: str = "warn"  # "warn" | "ignore" | "fallback"
@@ -39,6 +59,12 @@ class Rules:
     banned_words: list[str] | None = None
     date_range: DateRange = DateRange()
     limits: Limits = Limits()
+    # allowed_categories の frozenset（照合用）。apply_rules のたびに作り直さず、生成時に1回だけ作る
+    allowed_set: frozenset[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # frozen=True なので通常の代入はできず、object.__setattr__ で初期化する
+        object.__setattr__(self, "allowed_set", frozenset(self.allowed_categories or ()))
 
 
 def load_rules(path: Path) -> Rules:
@@ -50,15 +76,36 @@ def load_rules(path: Path) -> Rules:
 
     frozen=True のデータクラスを使うのは、ルール設定が処理中に
     意図せず変更されないよう不変（immutable）にするため。
+    不変なので、同じファイル・同じ版（更新時刻とサイズ）の間は同じ Rules を使い回しても安全。
+    """
+    st = path.stat()
+    # 相対パスや別名で指定されても同じファイルなら同じキャッシュを引けるよう、絶対パスにそろえる
+    return _load_rules_cached(str(path.resolve()), st.st_mtime_ns, st.st_size)
+
+
+# 結果を「絶対パス + 更新時刻 + サイズ」ごとに覚えておく。ファイルが書き換わると別のキーになる。
+# lru_cache は件数に上限があり（古い版は自然に追い出される）、スレッドから同時に呼んでも安全。
+@lru_cache(maxsize=32)
+def _load_rules_cached(path_str: str, mtime_ns: int, size: int) -> Rules:
+    # str へのデコードを挟まず、バイト列のまま解析に渡す
+    return parse_rules(Path(path_str).read_bytes())
+
+
+def parse_rules(text: str | bytes) -> Rules:
+    """rules.json の中身（文字列 / バイト列）を Rules に変換する。
+
+    ファイルの読み込みとキャッシュは load_rules 側が受け持ち、ここは JSON → Rules の変換だけを行う。
+    パスを経由しないので、ファイルにない設定（テストで組み立てた JSON など）もそのまま変換できる。
     """
-    data = json.loads(path.read_text(encoding="utf-8"))
+    data = _json_loads(text)
 
     allowed = data.get("allowed_categories")
     banned = data.get("banned_words")
 
-    # 想定外のモード値はデフォルトの "warn" に正規化する
-    mode = (data.get("unknown_category_mode") or "warn").lower()
-    if mode not in {"warn", "ignore", "fallback"}:
+    # 想定外のモード値（文字列以外も含む）はデフォルトの "warn" に正規化する
+    raw_mode = data.get("unknown_category_mode")
+    mode = raw_mode.lower() if isinstance(raw_mode, str) else "warn"
+    if mode not in _MODES:
         mode = "warn"
 
     fallback = data.get("fallback_category")
@@ -84,17 +131,19 @@ def load_rules(path: Path) -> Rules:
     )
 
 
+# apply_rules で各行から使う4列。itemgetter なら1回の C 呼び出しでまとめて取り出せる
+_ROW_FIELDS = itemgetter("date", "amount", "merchant", "category")
+
+
 def _valid_date(s: str) -> bool:
     """rules.json の date_range 値が正しい日付形式かを確認する。
 
     不正な日付が設定されていた場合、その条件を無視（None 扱い）する。
     これにより、設定ミスで全行が警告になるような誤動作を防ぐ。
+    判定は CSV の日付と同じ parse_date を使う（strptime を使わない・ゼロ埋めの YYYY-MM-DD のみ可）。
+    JSON に数値などが書かれていても例外にせず False を返す。
     """
-    try:
-        datetime.strptime(s, "%Y-%m-%d")
-        return True
-    except Exception:
-        return False
+    return isinstance(s, str) and parse_date(s)
 
 
 def apply_rules(rows: list[dict], rules: Rules) -> tuple[list[dict], list[dict[str, str]]]:
@@ -107,6 +156,7 @@ def apply_rules(rows: list[dict], rules: Rules) -> tuple[list[dict], list[dict[s
          → 全行を処理してから判定する（行単位では判断できないため）
 
     clean_rows は「fallback モード時にカテゴリを書き換えた後」のデータを含む。
+    書き換えのない行は rows と同じ辞書を共有するので、呼び出し側は読み取り専用として扱うこと。
     上限チェックも書き換え後のカテゴリで行うことで、集計が一貫する。
 
     rows: normalize_ok_rows 済み（row:str, date:str, amount:int, merchant:str, category:str）
@@ -116,17 +166,39 @@ def apply_rules(rows: list[dict], rules: Rules) -> tuple[list[dict], list[dict[s
     warnings: list[dict[str, str]] = []
     clean_rows: list[dict] = []
 
-    allowed_set = set(rules.allowed_categories or [])
-    banned_words = rules.banned_words or []
+    allowed_set = rules.allowed_set
+    # allowed_categories が空（未設定 = 全許可）ならカテゴリ照合そのものを行わない
+    check_allowed = bool(allowed_set)
+    # 空文字のワードはどの加盟店名にも含まれる扱いになるので、最初に1回だけ取り除いておく
+    banned_words = [w for w in (rules.banned_words or []) if w]
+    # 全ワードを1本の正規表現（選択 |）にまとめ、「どれか含むか」を C 実装の1回の走査で判定する。
+    # search が返すのは文中で最も左の一致なので、警告に出すワードは従来どおり
+    # banned_words の並び順で最初に含まれるものを改めて選ぶ（一致した加盟店だけ）。
+    banned_search = (
+        re.compile("|".join(map(re.escape, banned_words))).search if banned_words else None
+    )
+
+    # 同じ加盟店は何度も出てくるので、禁止ワードの判定結果は加盟店名ごとに1回だけ求めて覚えておく
+    # （値は最初に一致したワード。一致なしは None）
+    banned_hit: dict[str, str | None] = {}
 
     mode = rules.unknown_category_mode
     fb = rules.fallback_category or "その他"
 
     # 上限チェック用に全行の累積合計を保持する辞書
-    by_day_total: dict[str, int] = {}
-    by_month_total: dict[str, int] = {}
-    by_day_cat: dict[tuple[str, str], int] = {}
-    by_month_cat: dict[tuple[str, str], int] = {}
+    # defaultdict(int) なら初出のキーも += だけで加算できる（get と代入の2回引きが不要）
+    by_day_total: defaultdict[str, int] = defaultdict(int)
+    by_month_total: defaultdict[str, int] = defaultdict(int)
+    # カテゴリ別は「カテゴリ → 日付(月) → 合計」の2段にして、上限のあるカテゴリだけを見に行く
+    by_day_cat: defaultdict[str, defaultdict[str, int]] = defaultdict(lambda: defaultdict(int))
+    by_month_cat: defaultdict[str, defaultdict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    # 上限が設定されていない集計は後でチェックしないので、行ごとの加算自体を省く
+    lim = rules.limits
+    track_day = lim.daily_total is not None
+    track_month = lim.monthly_total is not None
+    track_day_cat = bool(lim.category_daily)
+    track_month_cat = bool(lim.category_monthly)
 
     # rules.json の日付値が不正な場合は None として扱い、その条件をスキップする
     date_min = (
@@ -140,19 +212,38 @@ def apply_rules(rows: list[dict], rules: Rules) -> tuple[list[dict], list[dict[s
         else None
     )
 
+    # 行単位の警告で共通する列（row, date, month, merchant, amount）は行ごとに1回だけ組み立て、
+    # 各チェックからは kind / category / message だけを渡す
+    base: tuple[str, str, str, str, int]
+
+    def warn(kind: str, category: str, message: str) -> None:
+        row_id, date_str, month, merchant, amount = base
+        warnings.append(
+            {
+                "kind": kind,
+                "row": row_id,
+                "date": date_str,
+                "month": month,
+                "category": category,
+                "merchant": merchant,
+                "amount": str(amount),
+                "message": message,
+            }
+        )
+
     for idx, r in enumerate(rows, start=2):
         row_id = str(r.get("row") or idx)
-        date_str = r["date"]
-        amount = int(r["amount"])
-        merchant = r["merchant"]
-        category = r["category"]
+        date_str, amount, merchant, category = _ROW_FIELDS(r)
+        amount = int(amount)
         month = date_str[:7]
+        base = (row_id, date_str, month, merchant, amount)
 
         # 未登録カテゴリのチェック
         # allowed_categories が空リストの場合はチェックしない（未設定 = 全許可）
-        is_unknown = bool(allowed_set) and (category not in allowed_set)
+        is_unknown = check_allowed and (category not in allowed_set)
         category_for_clean = category
         category_for_limit = category
+        rewritten = False  # fallback でカテゴリを書き換えたか（クリーン行のコピー要否）
 
         if is_unknown:
             if mode == "ignore":
@@ -161,168 +252,135 @@ def apply_rules(rows: list[dict], rules: Rules) -> tuple[list[dict], list[dict[s
             elif mode == "fallback":
                 # 未知カテゴリを fallback_category に置き換えて集計を続ける
                 # 警告は残すことで、後から確認できるようにしている
-                warnings.append(
-                    {
-                        "kind": "category_unknown",
-                        "row": row_id,
-                        "date": date_str,
-                        "month": month,
-                        "category": category,
-                        "merchant": merchant,
-                        "amount": str(amount),
-                        "message": f"未登録カテゴリのため {fb} 扱い: {category}",
-                    }
-                )
+                warn("category_unknown", category, f"未登録カテゴリのため {fb} 扱い: {category}")
                 category_for_clean = fb
                 category_for_limit = fb
+                rewritten = True
             else:  # warn
-                warnings.append(
-                    {
-                        "kind": "category_unknown",
-                        "row": row_id,
-                        "date": date_str,
-                        "month": month,
-                        "category": category,
-                        "merchant": merchant,
-                        "amount": str(amount),
-                        "message": f"未登録カテゴリ: {category}",
-                    }
-                )
+                warn("category_unknown", category, f"未登録カテゴリ: {category}")
 
         # 禁止ワードチェック（加盟店名に含まれているか）
-        # 最初に一致したワードで break することで、複数ヒットしても警告は1件にとどめる
-        for w in banned_words:
-            if w and (w in merchant):
-                warnings.append(
-                    {
-                        "kind": "banned_word",
-                        "row": row_id,
-                        "date": date_str,
-                        "month": month,
-                        "category": category_for_clean,
-                        "merchant": merchant,
-                        "amount": str(amount),
-                        "message": f"禁止ワードを含む: {w}",
-                    }
-                )
-                break
+        # 最初に一致したワードだけを使うことで、複数ヒットしても警告は1件にとどめる
+        if merchant in banned_hit:
+            hit = banned_hit[merchant]
+        else:
+            hit = None
+            if banned_search is not None and banned_search(merchant):
+                hit = next((w for w in banned_words if w in merchant), None)
+            banned_hit[merchant] = hit
+        if hit is not None:
+            warn("banned_word", category_for_clean, f"禁止ワードを含む: {hit}")
 
         # 日付範囲チェック: ISO 8601 形式（YYYY-MM-DD）は辞書順 = 時系列順なので
         # 文字列のまま比較できる。datetime への変換コストを省ける。
         if date_min and date_str < date_min:
-            warnings.append(
-                {
-                    "kind": "date_range",
-                    "row": row_id,
-                    "date": date_str,
-                    "month": month,
-                    "category": category_for_clean,
-                    "merchant": merchant,
-                    "amount": str(amount),
-                    "message": f"日付が範囲外（min={date_min}）",
-                }
-            )
+            warn("date_range", category_for_clean, f"日付が範囲外（min={date_min}）")
         if date_max and date_str > date_max:
-            warnings.append(
-                {
-                    "kind": "date_range",
-                    "row": row_id,
-                    "date": date_str,
-                    "month": month,
-                    "category": category_for_clean,
-                    "merchant": merchant,
-                    "amount": str(amount),
-                    "message": f"日付が範囲外（max={date_max}）",
-                }
-            )
+            warn("date_range", category_for_clean, f"日付が範囲外（max={date_max}）")
 
-        # fallback 後のカテゴリでクリーン行を生成する
-        r2 = dict(r)
-        r2["category"] = category_for_clean
-        clean_rows.append(r2)
+        # fallback 後のカテゴリでクリーン行を生成する。
+        # カテゴリを書き換えない行（大半）はコピーせず、入力の辞書をそのまま使う。
+        if rewritten:
+            clean_rows.append({**r, "category": category_for_clean})
+        else:
+            clean_rows.append(r)
 
         # 上限チェック用の累積合計を更新する（行ごとに加算）
-        by_day_total[date_str] = by_day_total.get(date_str, 0) + amount
-        by_month_total[month] = by_month_total.get(month, 0) + amount
-        by_day_cat[(date_str, category_for_limit)] = (
-            by_day_cat.get((date_str, category_for_limit), 0) + amount
-        )
-        by_month_cat[(month, category_for_limit)] = (
-            by_month_cat.get((month, category_for_limit), 0) + amount
-        )
-
-    lim = rules.limits
+        if track_day:
+            by_day_total[date_str] += amount
+        if track_month:
+            by_month_total[month] += amount
+        if track_day_cat:
+            by_day_cat[category_for_limit][date_str] += amount
+        if track_month_cat:
+            by_month_cat[category_for_limit][month] += amount
 
     # 上限チェックは全行の集計が完了してから行う（途中判定では合計が確定しないため）
+    # 出力順を日付・月順にそろえるためのソートは、上限を超えたキーだけに絞ってから行う
+    # （集計キー全体を並べ替えるより対象が少なく、出力される順番は従来と同じ）。
 
     # 日次合計の上限チェック
     if lim.daily_total is not None:
-        for d, total in sorted(by_day_total.items()):
-            if total > lim.daily_total:
-                warnings.append(
-                    {
-                        "kind": "limit_daily_total",
-                        "row": "",
-                        "date": d,
-                        "month": d[:7],
-                        "category": "",
-                        "merchant": "",
-                        "amount": str(total),
-                        "message": f"日次合計が上限超え: {total} > {lim.daily_total}",
-                    }
-                )
+        daily_limit = lim.daily_total
+        over_day = [(d, t) for d, t in by_day_total.items() if t > daily_limit]
+        for d, total in sorted(over_day):
+            warnings.append(
+                {
+                    "kind": "limit_daily_total",
+                    "row": "",
+                    "date": d,
+                    "month": d[:7],
+                    "category": "",
+                    "merchant": "",
+                    "amount": str(total),
+                    "message": f"日次合計が上限超え: {total} > {daily_limit}",
+                }
+            )
 
     # 月次合計の上限チェック
     if lim.monthly_total is not None:
-        for m, total in sorted(by_month_total.items()):
-            if total > lim.monthly_total:
-                warnings.append(
-                    {
-                        "kind": "limit_monthly_total",
-                        "row": "",
-                        "date": "",
-                        "month": m,
-                        "category": "",
-                        "merchant": "",
-                        "amount": str(total),
-                        "message": f"月次合計が上限超え: {total} > {lim.monthly_total}",
-                    }
-                )
+        monthly_limit = lim.monthly_total
+        over_month = [(m, t) for m, t in by_month_total.items() if t > monthly_limit]
+        for m, total in sorted(over_month):
+            warnings.append(
+                {
+                    "kind": "limit_monthly_total",
+                    "row": "",
+                    "date": "",
+                    "month": m,
+                    "category": "",
+                    "merchant": "",
+                    "amount": str(total),
+                    "message": f"月次合計が上限超え: {total} > {monthly_limit}",
+                }
+            )
 
     # カテゴリ別日次上限チェック（カテゴリごとに別の上限を設定できる）
     if lim.category_daily:
-        for (d, c), total in sorted(by_day_cat.items()):
-            limit_val = lim.category_daily.get(c)
-            if limit_val is not None and total > limit_val:
-                warnings.append(
-                    {
-                        "kind": "limit_category_daily",
-                        "row": "",
-                        "date": d,
-                        "month": d[:7],
-                        "category": c,
-                        "merchant": "",
-                        "amount": str(total),
-                        "message": f"カテゴリ日次合計が上限超え: {c} {total} > {limit_val}",
-                    }
-                )
+        cat_daily = lim.category_daily
+        over_day_cat = [
+            ((d, c), t, lv)
+            for c, lv in cat_daily.items()
+            if lv is not None and c in by_day_cat
+            for d, t in by_day_cat[c].items()
+            if t > lv
+        ]
+        for (d, c), total, limit_val in sorted(over_day_cat):
+            warnings.append(
+                {
+                    "kind": "limit_category_daily",
+                    "row": "",
+                    "date": d,
+                    "month": d[:7],
+                    "category": c,
+                    "merchant": "",
+                    "amount": str(total),
+                    "message": f"カテゴリ日次合計が上限超え: {c} {total} > {limit_val}",
+                }
+            )
 
     # カテゴリ別月次上限チェック
     if lim.category_monthly:
-        for (m, c), total in sorted(by_month_cat.items()):
-            limit_val = lim.category_monthly.get(c)
-            if limit_val is not None and total > limit_val:
-                warnings.append(
-                    {
-                        "kind": "limit_category_monthly",
-                        "row": "",
-                        "date": "",
-                        "month": m,
-                        "category": c,
-                        "merchant": "",
-                        "amount": str(total),
-                        "message": f"カテゴリ月次合計が上限超え: {c} {total} > {limit_val}",
-                    }
-                )
+        cat_monthly = lim.category_monthly
+        over_month_cat = [
+            ((m, c), t, lv)
+            for c, lv in cat_monthly.items()
+            if lv is not None and c in by_month_cat
+            for m, t in by_month_cat[c].items()
+            if t > lv
+        ]
+        for (m, c), total, limit_val in sorted(over_month_cat):
+            warnings.append(
+                {
+                    "kind": "limit_category_monthly",
+                    "row": "",
+                    "date": "",
+                    "month": m,
+                    "category": c,
+                    "merchant": "",
+                    "amount": str(total),
+                    "message": f"カテゴリ月次合計が上限超え: {c} {total} > {limit_val}",
+                }
+            )
 
     return clean_rows, warnings
@@ -1,6 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from expense_core import check_rows, make_summary, normalize_ok_rows, parse_amount, parse_date
+from pathlib import Path
+
+import pytest
+
+from expense_core import (
+    ExpenseRowNorm,
+    check_rows,
+    iter_csv_from_bytes,
+    iter_row_values,
+    make_summary,
+    normalize_ok_rows,
+    parse_amount,
+    parse_date,
+    read_csv,
+)
+from html_report import write_html_report
+from rules import DateRange, Limits, Rules, apply_rules, load_rules
 
 #parse_date() が YYYY-MM-DD だけ True になるか
 
@@ -8,6 +24,11 @@ def test_parse_date():
     assert parse_date("2026-01-10") is True
     assert parse_date("2026/01/10") is False
     assert parse_date("") is False
+    assert parse_date("2024-02-29") is True
+    assert parse_date("2023-02-29") is False
+    assert parse_date("2026-13-01") is False
+    assert parse_date("2026-04-31") is False
+    assert parse_date("2026-1-10") is False
 
 #parse_amount() が整数文字列だけ True になるか
 
@@ -15,6 +36,12 @@ def test_parse_amount():
     assert parse_amount("1200") is True
     assert parse_amount("12.5") is False
     assert parse_amount("abc") is False
+    assert parse_amount("-500") is True
+    assert parse_amount("") is False
+    assert parse_amount("+") is False
+    assert parse_amount("1,200") is False
+    assert parse_amount("1_000") is False
+    assert parse_amount(" 100") is False
 
 #check_rows() が「OK行とエラー行」に分けられるか
 
@@ -31,3 +58,136 @@ def test_check_rows_and_summary():
     summary = make_summary(ok_norm, top_n=10)
     # month_total のヘッダ + 1行以上
     assert any(r["type"] == "month_total" for r in summary)
+
+#make_summary() の平均・中央値が、マイナス金額・偶数件でも 0 方向に切り捨てられるか
+
+def test_make_summary_stats_truncate_toward_zero():
+    amounts = [-7, -4, 1, 2]  # 平均 -2, 中央値 -1.5 → int() で -1
+    rows: list[ExpenseRowNorm] = [
+        {"row": str(i), "date": "2026-01-10", "amount": a, "merchant": f"m{i}", "category": "c"}
+        for i, a in enumerate(amounts, start=2)
+    ]
+    stats = {r["key"]: r["value"] for r in make_summary(rows) if r["type"] == "stats"}
+    assert stats["median"] == "-1"
+    assert stats["average"] == "-2"
+
+    rows[0]["amount"] = -6  # 平均 -7/4 = -1.75 → -1（// だと -2 になる）
+    stats = {r["key"]: r["value"] for r in make_summary(rows) if r["type"] == "stats"}
+    assert stats["average"] == "-1"
+    assert stats["min"] == "-6"
+    assert stats["max"] == "2"
+
+#iter_csv_from_bytes() / read_csv() が BOM 付きの CSV でも列名を正しく読めるか
+
+def test_csv_readers_strip_bom(tmp_path):
+    data = "date,amount,merchant,category\r\n2026-01-10,1200,A,消耗品\r\n".encode("utf-8-sig")
+    rows = list(iter_csv_from_bytes(data))
+    assert rows == [{"date": "2026-01-10", "amount": "1200", "merchant": "A", "category": "消耗品"}]
+
+    # ファイルから読む iter_csv（CLI の入口）でも同じ結果になるか
+    path = tmp_path / "bom.csv"
+    path.write_bytes(data)
+    assert read_csv(path) == rows
+
+#read_csv() が pathlib.Path を受け取ってもファイルとして開けるか
+
+def test_read_csv_accepts_path(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("date,amount,merchant,category\n2026-01-10,1200,A,消耗品\n", encoding="utf-8")
+    assert read_csv(path) == read_csv(str(path))
+    assert len(read_csv(Path(__file__).parent.parent / "data" / "sample_bad.csv")) == 11
+
+#iter_row_values() が列順に値を取り出し、欠けているキーを "" で埋めるか
+
+def test_iter_row_values_fills_missing_keys():
+    rows = [{"a": "1", "b": "2", "x": "ignored"}, {"a": "3"}]
+    assert list(iter_row_values(rows, ["b", "a"])) == [("2", "1"), ("", "3")]
+    assert list(iter_row_values(rows, ["b"])) == [("2",), ("",)]
+
+#load_rules() がファイル未変更ならキャッシュを返し、書き換え後は読み直すか
+
+def test_load_rules_cache_follows_file_changes(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"banned_words": ["a"]}', encoding="utf-8")
+    first = load_rules(path)
+    assert load_rules(path) is first
+
+    path.write_text('{"banned_words": ["a", "bb"]}', encoding="utf-8")
+    assert load_rules(path).banned_words == ["a", "bb"]
+
+#apply_rules() の上限警告が日付（月）→カテゴリ（文字コード順）の順に並ぶか
+
+def test_apply_rules_limit_warning_order():
+    def row(n, d, amount, cat):
+        return {"row": str(n), "date": d, "amount": amount, "merchant": "M", "category": cat}
+
+    rows = [
+        row(2, "2026-02-01", 300, "交通費"),
+        row(3, "2026-01-15", 300, "会議費"),
+        row(4, "2026-01-15", 300, "交通費"),
+        row(5, "2026-01-03", 50, "交通費"),
+        row(6, "2026-01-03", 300, "会議費"),
+    ]
+    rules = Rules(
+        limits=Limits(
+            daily_total=500,
+            monthly_total=800,
+            category_daily={"交通費": 100, "会議費": 100},
+            category_monthly={"会議費": 100},
+        )
+    )
+    _, warnings = apply_rules(rows, rules)
+    got = [(w["kind"], w["date"], w["month"], w["category"]) for w in warnings]
+    assert got == [
+        ("limit_daily_total", "2026-01-15", "2026-01", ""),
+        ("limit_monthly_total", "", "2026-01", ""),
+        ("limit_category_daily", "2026-01-03", "2026-01", "会議費"),
+        ("limit_category_daily", "2026-01-15", "2026-01", "交通費"),
+        ("limit_category_daily", "2026-01-15", "2026-01", "会議費"),
+        ("limit_category_daily", "2026-02-01", "2026-02", "交通費"),
+        ("limit_category_monthly", "", "2026-01", "会議費"),
+    ]
+
+#fallback モードでカテゴリを書き換えた行だけがコピーされるか
+
+def test_apply_rules_fallback_copies_only_rewritten_rows():
+    known = {"row": "2", "date": "2026-01-10", "amount": 100, "merchant": "A", "category": "交通費"}
+    unknown = {"row": "3", "date": "2026-01-10", "amount": 100, "merchant": "B", "category": "謎"}
+    rules = Rules(
+        allowed_categories=["交通費"], unknown_category_mode="fallback", fallback_category="その他"
+    )
+    clean, warnings = apply_rules([known, unknown], rules)
+    assert clean[0] is known
+    assert clean[1] is not unknown
+    assert clean[1]["category"] == "その他"
+    assert unknown["category"] == "謎"
+    assert [w["kind"] for w in warnings] == ["category_unknown"]
+
+#禁止ワードの警告が、加盟店名の中の位置ではなく banned_words の並び順で最初のワードになるか
+
+def test_apply_rules_reports_first_banned_word_in_list_order():
+    merchant = "パチンコでギフト券"
+    rows = [{"row": "2", "date": "2026-01-10", "amount": 1, "merchant": merchant, "category": "c"}]
+    _, warnings = apply_rules(rows, Rules(banned_words=["", "ギフト券", "パチンコ"]))
+    assert [w["message"] for w in warnings] == ["禁止ワードを含む: ギフト券"]
+
+#上限・日付範囲などが未設定なら警告が出ないか
+
+def test_apply_rules_without_limits_emits_no_warnings():
+    rows = [
+        {"row": "2", "date": "2026-01-10", "amount": 10**9, "merchant": "A", "category": "交通費"},
+    ]
+    clean, warnings = apply_rules(rows, Rules(limits=Limits(), date_range=DateRange()))
+    assert warnings == []
+    assert clean == rows
+
+#write_html_report() が途中で失敗しても、既存の report.html を書きかけで壊さないか
+
+def test_write_html_report_keeps_existing_file_on_error(tmp_path):
+    path = tmp_path / "report.html"
+    path.write_text("old", encoding="utf-8")
+    bad_summary = [{"type": "month_total", "key": "2026-01", "value": "x"}]
+    with pytest.raises(ValueError):
+        write_html_report(path=path, errors=[], warnings=[], clean=[], summary=bad_summary)
+    assert path.read_text(encoding="utf-8") == "old"
+    assert list(tmp_path.iterdir()) == [path]